@@ -2,22 +2,39 @@ import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
 import datetime
-import csv
+import math
 import os
+import time
 import traceback
 import logging
+import logging.handlers
 from typing import List, Dict, Optional
 from dataclasses import dataclass
 from enum import Enum
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # ==================== 日志配置 ====================
+# 设置环境变量FINANCE_DEBUG时输出DEBUG日志，并同时打印到控制台
+DEBUG_MODE = bool(os.environ.get('FINANCE_DEBUG'))
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+_file_handler = logging.FileHandler('finance_debug.log', encoding='utf-8')
+_file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+# 日志先缓存在内存中批量写入文件，出现ERROR及以上级别时立即写入
+_log_handlers = [
+    logging.handlers.MemoryHandler(capacity=512, flushLevel=logging.ERROR, target=_file_handler)
+]
+if DEBUG_MODE:
+    _log_handlers.append(logging.StreamHandler())
+
 logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('finance_debug.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
+    level=logging.DEBUG if DEBUG_MODE else logging.INFO,
+    format=LOG_FORMAT,
+    handlers=_log_handlers
 )
 logger = logging.getLogger(__name__)
 
@@ -28,6 +45,9 @@ class TransactionType(Enum):
 
 @dataclass
 class Transaction:
+    # 账本可能有大量记录，使用__slots__省去每条记录的__dict__
+    __slots__ = ('id', 'type', 'category', 'amount', 'date', 'description')
+    
     id: int
     type: TransactionType
     category: str
@@ -45,8 +65,39 @@ class Transaction:
             'description': self.description
         }
 
+def _dumps_line(obj) -> bytes:
+    """序列化为一行UTF-8编码的JSON，优先使用orjson"""
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(obj, ensure_ascii=False, separators=(',', ':')) + '\n').encode('utf-8')
+
+_loads = orjson.loads if orjson is not None else json.loads
+
+# 列表中描述列最多显示的字符数
+DESC_PREVIEW_LEN = 20
+
+def _preview(text: str) -> str:
+    """截断过长的描述用于列表显示"""
+    if len(text) <= DESC_PREVIEW_LEN:
+        return text
+    return text[:DESC_PREVIEW_LEN] + "..."
+
+def _csv_field(value: str) -> str:
+    """按CSV规则转义字段，仅在包含特殊字符时加引号"""
+    if ',' in value or '"' in value or '\n' in value or '\r' in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
 # ==================== 核心业务类 ====================
 class FinanceManager:
+    DATA_FILE = 'transactions.jsonl'
+    LEGACY_DATA_FILE = 'transactions.json'
+    # 压缩前将无法解析的原始记录备份到该文件，便于人工恢复
+    REJECTED_FILE = 'transactions.jsonl.rejected'
+    # 缓冲的记录达到条数或时间阈值时才写入磁盘
+    FLUSH_BATCH_SIZE = 32
+    FLUSH_INTERVAL = 2.0
+
     def __init__(self):
         self.transactions: List[Transaction] = []
         self.next_id = 1
@@ -54,67 +105,178 @@ class FinanceManager:
             '收入': ['工资', '奖金', '投资回报', '其他收入'],
             '支出': ['餐饮', '交通', '购物', '娱乐', '住房', '医疗']
         }
+        self._fp = None
+        self._needs_compaction = False
+        self._rejected: List[bytes] = []
+        self._pending: List[bytes] = []
+        self._pending_since = 0.0
+        # 单槽缓存：同一秒内添加的记录复用已格式化的时间字符串
+        self._last_ts_sec = 0
+        self._last_ts_str = ''
+        # 收支汇总随记录增量维护，get_summary无需重新遍历
+        self._totals = {TransactionType.INCOME: 0.0, TransactionType.EXPENSE: 0.0}
+        self._cat_totals = {TransactionType.INCOME: {}, TransactionType.EXPENSE: {}}
+        # 按类型分组的记录列表，筛选时直接返回
+        self._by_type = {TransactionType.INCOME: [], TransactionType.EXPENSE: []}
         self._load_data()
+        if self._needs_compaction:
+            self.save_data()
+        self._open_data_file()
+    
+    def _open_data_file(self):
+        """以追加模式打开数据文件，新增记录只需写入一行"""
+        self._fp = open(self.DATA_FILE, 'ab', buffering=1 << 16)
     
     def _load_data(self):
-        """加载数据 - 添加详细日志"""
+        """加载数据 - 逐行读取JSONL文件"""
         try:
-            if os.path.exists('transactions.json'):
+            if os.path.exists(self.DATA_FILE):
                 logger.info("开始加载数据文件")
-                with open('transactions.json', 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    logger.info(f"读取到 {len(data)} 条交易记录")
-                    
-                    for item in data:
-                        try:
-                            transaction = Transaction(
-                                id=item['id'],
-                                type=TransactionType(item['type']),
-                                category=item['category'],
-                                amount=item['amount'],
-                                date=item['date'],
-                                description=item['description']
-                            )
-                            self.transactions.append(transaction)
-                        except KeyError as e:
-                            logger.error(f"数据字段缺失: {e}, 数据: {item}")
-                        except ValueError as e:
-                            logger.error(f"数据类型错误: {e}, 数据: {item}")
-                    
-                    if self.transactions:
-                        self.next_id = max(t.id for t in self.transactions) + 1
-                        logger.info(f"下一个ID设置为: {self.next_id}")
+                with open(self.DATA_FILE, 'rb') as f:
+                    for line in f:
+                        if not line.strip():
+                            continue
+                        self._load_item(line)
+                logger.info(f"读取到 {len(self.transactions)} 条交易记录")
+            elif os.path.exists(self.LEGACY_DATA_FILE):
+                logger.info("发现旧版数据文件，将迁移为JSONL格式")
+                with open(self.LEGACY_DATA_FILE, 'rb') as f:
+                    for item in _loads(f.read()):
+                        self._load_item(item)
+                logger.info(f"读取到 {len(self.transactions)} 条交易记录")
+                self._needs_compaction = True
             else:
                 logger.info("数据文件不存在，将创建新文件")
+            
+            if self.transactions:
+                logger.info(f"下一个ID设置为: {self.next_id}")
                 
         except json.JSONDecodeError as e:
             logger.error(f"JSON解析错误: {e}")
             messagebox.showwarning("数据错误", "数据文件格式错误，将创建新文件")
+            self._cancel_compaction()
         except Exception as e:
             logger.error(f"加载数据失败: {e}\n{traceback.format_exc()}")
+            self._cancel_compaction()
+    
+    def _cancel_compaction(self):
+        """加载中途失败时内存中的记录不完整，不能用它们重写数据文件"""
+        self._needs_compaction = False
+        self._rejected.clear()
+    
+    def _timestamp(self) -> str:
+        """返回当前时间字符串，同一秒内不重复调用strftime"""
+        sec = int(time.time())
+        if sec != self._last_ts_sec:
+            self._last_ts_str = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(sec))
+            self._last_ts_sec = sec
+        return self._last_ts_str
+    
+    def _accumulate(self, transaction: Transaction):
+        """将一条记录计入分组列表和汇总，字段类型错误时抛出TypeError且不修改任何汇总"""
+        total = self._totals[transaction.type] + transaction.amount
+        totals = self._cat_totals[transaction.type]
+        category_total = totals.get(transaction.category, 0) + transaction.amount
+        self._totals[transaction.type] = total
+        totals[transaction.category] = category_total
+        self._by_type[transaction.type].append(transaction)
+    
+    def _load_item(self, item):
+        """解析单条记录，格式错误的记录会被跳过，备份后从数据文件中压缩掉"""
+        raw = item
+        try:
+            if isinstance(item, bytes):
+                item = _loads(item)
+            transaction = Transaction(
+                id=item['id'],
+                type=TransactionType(item['type']),
+                category=item['category'],
+                amount=item['amount'],
+                date=item['date'],
+                description=item['description']
+            )
+            # 加载时顺带维护最大ID，无需再遍历一次
+            next_id = max(self.next_id, transaction.id + 1)
+            self._accumulate(transaction)
+            self.transactions.append(transaction)
+            self.next_id = next_id
+        except KeyError as e:
+            logger.error(f"数据字段缺失: {e}, 数据: {item}")
+            self._reject(raw)
+        except (ValueError, TypeError) as e:
+            logger.error(f"数据类型错误: {e}, 数据: {item}")
+            self._reject(raw)
+    
+    def _reject(self, raw):
+        """记下无法加载的原始记录，压缩数据文件前先写入备份文件"""
+        self._rejected.append(raw if isinstance(raw, bytes) else _dumps_line(raw))
+        self._needs_compaction = True
+    
+    def _save_rejected(self):
+        """将无法加载的原始记录追加到备份文件"""
+        if not self._rejected:
+            return
+        with open(self.REJECTED_FILE, 'ab') as f:
+            f.writelines(line if line.endswith(b'\n') else line + b'\n'
+                         for line in self._rejected)
+        logger.warning("已将 %d 条无法加载的记录备份到 %s", len(self._rejected), self.REJECTED_FILE)
+        self._rejected.clear()
     
     def save_data(self):
-        """保存数据"""
+        """压缩数据文件：用内存中的记录整体重写JSONL文件"""
         try:
-            logger.debug(f"开始保存 {len(self.transactions)} 条记录")
-            with open('transactions.json', 'w', encoding='utf-8') as f:
-                json.dump([t.to_dict() for t in self.transactions], f, 
-                         ensure_ascii=False, indent=2)
+            logger.debug("开始保存 %d 条记录", len(self.transactions))
+            # 先备份被跳过的记录，备份失败时不会覆盖原数据文件
+            self._save_rejected()
+            if self._fp is not None:
+                self._fp.close()
+            tmp_path = self.DATA_FILE + '.tmp'
+            with open(tmp_path, 'wb') as f:
+                f.writelines(_dumps_line(t.to_dict()) for t in self.transactions)
+            os.replace(tmp_path, self.DATA_FILE)
+            self._pending.clear()
+            self._needs_compaction = False
             logger.info("数据保存成功")
         except Exception as e:
             logger.error(f"保存数据失败: {e}\n{traceback.format_exc()}")
             raise
+        finally:
+            if self._fp is not None:
+                self._open_data_file()
+    
+    def sync(self):
+        """将缓冲的记录写入数据文件"""
+        if not self._pending:
+            return
+        self._fp.writelines(self._pending)
+        self._fp.flush()
+        self._pending.clear()
+    
+    def close(self):
+        """刷新并关闭数据文件"""
+        if self._fp is None:
+            return
+        self.sync()
+        if self._needs_compaction:
+            self.save_data()
+        self._fp.close()
+        self._fp = None
     
     def add_transaction(self, type_: TransactionType, category: str, 
                        amount: float, description: str = "") -> Transaction:
         """添加交易记录 - 添加详细验证"""
-        logger.debug(f"添加交易: type={type_}, category={category}, amount={amount}")
+        logger.debug("添加交易: type=%s, category=%s, amount=%s", type_, category, amount)
         
         # 验证输入
         if not category or category.strip() == "":
             logger.error("类别为空")
             raise ValueError("请选择交易类别")
         
+        # NaN/inf能通过下面的范围检查，但orjson与json序列化结果不一致
+        if not math.isfinite(amount):
+            logger.error(f"金额无效: {amount}")
+            raise ValueError("金额必须是有效数字")
+        
         if amount <= 0:
             logger.error(f"金额无效: {amount}")
             raise ValueError("金额必须大于0")
@@ -129,15 +291,22 @@ class FinanceManager:
                 type=type_,
                 category=category.strip(),
                 amount=round(float(amount), 2),
-                date=datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                date=self._timestamp(),
                 description=description.strip()
             )
             
+            if not self._pending:
+                self._pending_since = time.monotonic()
+            self._pending.append(_dumps_line(transaction.to_dict()))
             self.transactions.append(transaction)
+            self._accumulate(transaction)
             self.next_id += 1
-            self.save_data()
             
-            logger.info(f"交易添加成功: ID={transaction.id}")
+            if (len(self._pending) >= self.FLUSH_BATCH_SIZE
+                    or time.monotonic() - self._pending_since >= self.FLUSH_INTERVAL):
+                self.sync()
+            
+            logger.info("交易添加成功: ID=%s", transaction.id)
             return transaction
             
         except Exception as e:
@@ -146,41 +315,33 @@ class FinanceManager:
     
     def get_transactions(self, filter_type: Optional[TransactionType] = None) -> List[Transaction]:
         if filter_type:
-            return [t for t in self.transactions if t.type == filter_type]
+            return self._by_type[filter_type]
         return self.transactions
     
     def get_summary(self) -> Dict:
-        total_income = sum(t.amount for t in self.transactions if t.type == TransactionType.INCOME)
-        total_expense = sum(t.amount for t in self.transactions if t.type == TransactionType.EXPENSE)
-        balance = total_income - total_expense
-        
-        income_by_category = {}
-        expense_by_category = {}
-        
-        for t in self.transactions:
-            if t.type == TransactionType.INCOME:
-                income_by_category[t.category] = income_by_category.get(t.category, 0) + t.amount
-            else:
-                expense_by_category[t.category] = expense_by_category.get(t.category, 0) + t.amount
+        total_income = self._totals[TransactionType.INCOME]
+        total_expense = self._totals[TransactionType.EXPENSE]
         
         return {
             'total_income': total_income,
             'total_expense': total_expense,
-            'balance': balance,
-            'income_by_category': income_by_category,
-            'expense_by_category': expense_by_category
+            'balance': total_income - total_expense,
+            'income_by_category': dict(self._cat_totals[TransactionType.INCOME]),
+            'expense_by_category': dict(self._cat_totals[TransactionType.EXPENSE])
         }
     
     def export_to_csv(self, filename: str):
         try:
-            with open(filename, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.writer(f)
-                writer.writerow(['ID', '类型', '类别', '金额', '日期', '描述'])
-                for t in self.transactions:
-                    writer.writerow([
-                        t.id, t.type.value, t.category, 
-                        t.amount, t.date, t.description
-                    ])
+            # 一次性拼接全部内容后整体写入，避免逐行调用csv.writer
+            lines = ['ID,类型,类别,金额,日期,描述']
+            lines.extend(
+                f"{t.id},{t.type.value},{_csv_field(t.category)},{t.amount:.2f},"
+                f"{_csv_field(t.date)},{_csv_field(t.description)}"
+                for t in self.transactions
+            )
+            lines.append('')
+            with open(filename, 'w', newline='', encoding='utf-8', buffering=1 << 20) as f:
+                f.write('\r\n'.join(lines))
             logger.info(f"数据已导出到: {filename}")
             return True
         except Exception as e:
@@ -192,6 +353,10 @@ class FinanceApp:
     def __init__(self):
         logger.info("启动财务管理系统")
         self.finance_manager = FinanceManager()
+        # 类别固定不变，预先转换为元组，类型未变化时不重复设置下拉框
+        self._cat_tuples = {k: tuple(v) for k, v in self.finance_manager.categories.items()}
+        self._last_cat_type = None
+        self._sync_job = None
         self.setup_ui()
     
     def setup_ui(self):
@@ -267,11 +432,11 @@ class FinanceApp:
                 self.tree.column(col, width=100)
         
         # 滚动条
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
-        self.tree.configure(yscrollcommand=scrollbar.set)
+        self.scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=self.scrollbar.set)
         
         self.tree.grid(row=0, column=0, sticky=(tk.W, tk.E, tk.N, tk.S))
-        scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
+        self.scrollbar.grid(row=0, column=1, sticky=(tk.N, tk.S))
         
         # 过滤器
         filter_frame = ttk.Frame(list_frame)
@@ -321,8 +486,10 @@ class FinanceApp:
     def update_categories(self):
         """更新类别下拉框"""
         selected_type = self.type_var.get()
-        categories = self.finance_manager.categories.get(selected_type, [])
-        self.category_combo['values'] = categories
+        categories = self._cat_tuples.get(selected_type, ())
+        if selected_type != self._last_cat_type:
+            self.category_combo['values'] = categories
+            self._last_cat_type = selected_type
         if categories:
             self.category_combo.set(categories[0])
         else:
@@ -339,7 +506,7 @@ class FinanceApp:
             amount_str = self.amount_var.get()
             description = self.desc_text.get("1.0", tk.END).strip()
             
-            logger.debug(f"输入值: type={type_str}, category={category}, amount={amount_str}")
+            logger.debug("输入值: type=%s, category=%s, amount=%s", type_str, category, amount_str)
             
             # 验证输入
             error_messages = []
@@ -350,7 +517,7 @@ class FinanceApp:
             
             try:
                 amount = float(amount_str)
-                logger.debug(f"金额解析成功: {amount}")
+                logger.debug("金额解析成功: %s", amount)
             except ValueError:
                 error_messages.append("金额必须是数字")
                 logger.error(f"金额解析失败: {amount_str}")
@@ -371,12 +538,13 @@ class FinanceApp:
             self.amount_var.set("0.00")
             self.desc_text.delete("1.0", tk.END)
             self.status_var.set(f"交易添加成功 (ID: {transaction.id})")
+            self.schedule_sync()
             
             # 刷新显示
             self.refresh_list()
             self.update_summary()
             
-            logger.info(f"交易添加完成: ID={transaction.id}")
+            logger.info("交易添加完成: ID=%s", transaction.id)
             
         except ValueError as e:
             logger.error(f"验证错误: {e}")
@@ -385,41 +553,60 @@ class FinanceApp:
             logger.error(f"添加失败: {e}\n{traceback.format_exc()}")
             messagebox.showerror("系统错误", f"添加失败: {str(e)}")
     
+    def schedule_sync(self):
+        """确保缓冲中的交易在FLUSH_INTERVAL秒内写入磁盘"""
+        if self._sync_job is None:
+            self._sync_job = self.root.after(
+                int(FinanceManager.FLUSH_INTERVAL * 1000), self.sync_data
+            )
+    
+    def sync_data(self):
+        """定时将缓冲中的交易写入磁盘"""
+        self._sync_job = None
+        try:
+            self.finance_manager.sync()
+        except Exception as e:
+            logger.error(f"写入数据失败: {e}\n{traceback.format_exc()}")
+            self.status_var.set("写入数据失败，请查看日志")
+    
     def refresh_list(self, event=None):
         """刷新交易列表"""
         try:
+            # 批量插入期间断开滚动条，避免每插入一行都回调更新
+            self.tree.configure(yscrollcommand='')
+            
             # 清空现有项
-            for item in self.tree.get_children():
-                self.tree.delete(item)
+            children = self.tree.get_children()
+            if children:
+                self.tree.delete(*children)
             
             # 获取过滤条件
             filter_type = self.filter_var.get()
-            transactions = self.finance_manager.get_transactions()
+            transactions = self.finance_manager.get_transactions(
+                None if filter_type == "全部" else TransactionType(filter_type)
+            )
             
-            # 应用过滤
-            if filter_type == "收入":
-                transactions = [t for t in transactions if t.type == TransactionType.INCOME]
-            elif filter_type == "支出":
-                transactions = [t for t in transactions if t.type == TransactionType.EXPENSE]
+            # 先格式化所有行，再依次追加到Treeview末尾（最新的在前面）
+            rows = [(
+                transaction.id,
+                transaction.type.value,
+                transaction.category,
+                f"¥{transaction.amount:.2f}",
+                transaction.date,
+                _preview(transaction.description)
+            ) for transaction in reversed(transactions)]
             
-            # 添加项到Treeview
-            for transaction in reversed(transactions):  # 最新的在前面
-                self.tree.insert('', 0, values=(
-                    transaction.id,
-                    transaction.type.value,
-                    transaction.category,
-                    f"¥{transaction.amount:.2f}",
-                    transaction.date,
-                    transaction.description[:20] + "..." if len(transaction.description) > 20 
-                    else transaction.description
-                ))
+            for row in rows:
+                self.tree.insert('', 'end', values=row)
             
-            logger.debug(f"列表刷新完成，显示 {len(transactions)} 条记录")
+            logger.debug("列表刷新完成，显示 %d 条记录", len(transactions))
             self.status_var.set(f"显示 {len(transactions)} 条记录")
             
         except Exception as e:
             logger.error(f"刷新列表失败: {e}\n{traceback.format_exc()}")
             self.status_var.set("刷新失败")
+        finally:
+            self.tree.configure(yscrollcommand=self.scrollbar.set)
     
     def update_summary(self):
         """更新摘要信息"""
@@ -442,7 +629,7 @@ class FinanceApp:
                 foreground=balance_color
             )
             
-            logger.debug(f"摘要更新: 收入={summary['total_income']}, 支出={summary['total_expense']}")
+            logger.debug("摘要更新: 收入=%s, 支出=%s", summary['total_income'], summary['total_expense'])
             
         except Exception as e:
             logger.error(f"更新摘要失败: {e}\n{traceback.format_exc()}")
@@ -471,6 +658,13 @@ class FinanceApp:
     def on_closing(self):
         """关闭窗口时的清理工作"""
         logger.info("应用程序关闭")
+        if self._sync_job is not None:
+            self.root.after_cancel(self._sync_job)
+            self._sync_job = None
+        try:
+            self.finance_manager.close()
+        except Exception as e:
+            logger.error(f"关闭数据文件失败: {e}\n{traceback.format_exc()}")
         self.root.destroy()
     
     def run(self):
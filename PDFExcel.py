@@ -1,16 +1,73 @@
+import io
 import os
-import PyPDF2
+import re
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pypdf
 import pandas as pd
 import chardet
 from tkinter import Tk, ttk, filedialog, messagebox
 from tkinter.constants import END
 
+# 页数达到该值才启用多进程拆分，页数较少时进程启动开销得不偿失
+PARALLEL_MIN_PAGES = 64
+
+# 多进程拆分时每批至少包含的页数
+MIN_BATCH_PAGES = 8
+
+# 拆分进行中界面轮询进度的间隔（毫秒）
+PROGRESS_POLL_MS = 50
+
+# 文件名只保留字母数字（\w含下划线）、空格、连字符和中英文括号
+_UNSAFE_FILENAME_CHARS = re.compile(r'[^\w \-()（）]')
+
+
+def _dedupe_names(safe_names):
+    """为重名的页面追加_2、_3等后缀，避免多个进程同时写入同一文件"""
+    # Windows文件名不区分大小写，比较时统一折叠大小写
+    used = set()
+    result = []
+    for name in safe_names:
+        unique = name
+        suffix = 2
+        while unique.casefold() in used:
+            unique = f"{name}_{suffix}"
+            suffix += 1
+        used.add(unique.casefold())
+        result.append(unique)
+    return result
+
+
+def _write_page(reader, index, safe_name, output_folder):
+    """将单页写出为独立的PDF文件"""
+    writer = pypdf.PdfWriter()
+    writer.add_page(reader.pages[index])
+
+    output_path = os.path.join(output_folder, f"{safe_name}.pdf")
+    with open(output_path, 'wb', buffering=1 << 20) as output_pdf:
+        writer.write(output_pdf)
+
+
+def _write_pages(pdf_path, output_folder, jobs):
+    """子进程任务：只解析一次源PDF并写出一批页面，返回写出的页数"""
+    with open(pdf_path, 'rb') as pdf_file:
+        reader = pypdf.PdfReader(pdf_file)
+        for index, safe_name in jobs:
+            _write_page(reader, index, safe_name, output_folder)
+    return len(jobs)
+
 class PDFSplitterApp:
     def __init__(self, root):
         self.root = root
         self.root.title("PDF拆分工具 v2.0")
         self.root.resizable(False, False)
+        self._split_thread = None
+        self._split_error = None
+        self._progress_total = 0
+        self._progress_n = 0
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
         
     def setup_ui(self):
         """初始化用户界面"""
@@ -35,8 +92,15 @@ class PDFSplitterApp:
         self.progress.grid(row=3, column=0, columnspan=3, padx=10, pady=10)
 
         # 开始按钮
-        ttk.Button(self.root, text="开始拆分", command=self.start_split).grid(
-            row=4, column=1, pady=10, ipadx=20, ipady=5)
+        self.start_button = ttk.Button(self.root, text="开始拆分", command=self.start_split)
+        self.start_button.grid(row=4, column=1, pady=10, ipadx=20, ipady=5)
+
+    def on_closing(self):
+        """关闭窗口；拆分进行中时拒绝关闭，避免留下写了一半的文件"""
+        if self._split_thread is not None:
+            messagebox.showwarning("正在拆分", "PDF拆分尚未完成，请等待完成后再关闭窗口")
+            return
+        self.root.destroy()
 
     def select_pdf_file(self):
         """选择PDF文件"""
@@ -62,46 +126,67 @@ class PDFSplitterApp:
         self.csv_entry.delete(0, END)
         self.csv_entry.insert(0, file_path)
 
-    def detect_file_encoding(self, file_path):
-        """自动检测文件编码"""
-        with open(file_path, 'rb') as f:
-            rawdata = f.read(100000)  # 读取前100KB用于检测
-            return chardet.detect(rawdata)['encoding']
+    def detect_encoding(self, rawdata):
+        """自动检测文件内容的编码"""
+        # 带BOM的文件直接由BOM确定编码
+        if rawdata.startswith(b'\xef\xbb\xbf'):
+            return 'utf-8-sig'
+        if rawdata.startswith((b'\xff\xfe', b'\xfe\xff')):
+            return 'utf-16'
+
+        # 大多数文件是UTF-8，能完整解码即可直接确定
+        try:
+            rawdata.decode('utf-8')
+            return 'utf-8'
+        except UnicodeDecodeError:
+            pass
+
+        encoding = chardet.detect(rawdata[:65536])['encoding']  # 取前64KB用于检测
+        # GB2312/GBK均为GB18030的子集，统一按GB18030解码以兼容生僻字
+        if encoding and encoding.lower() in ('gb2312', 'gbk'):
+            return 'gb18030'
+        return encoding
 
     def read_name_file(self, file_path):
         """读取包含名称的文件（支持CSV和Excel）"""
         if not os.path.exists(file_path):
             raise FileNotFoundError("文件不存在")
         
-        # 自动检测编码（仅对CSV有效）
+        # 自动检测编码（仅对CSV有效），只解码和解析一次
         if file_path.lower().endswith('.csv'):
-            encoding = self.detect_file_encoding(file_path)
-            encodings_to_try = [encoding, 'gb18030', 'gbk', 'utf-8', 'utf-16', 'latin1']
-            
-            for enc in encodings_to_try:
-                try:
-                    return pd.read_csv(file_path, encoding=enc)
-                except UnicodeDecodeError:
-                    continue
-                except Exception:
-                    break
+            with open(file_path, 'rb') as f:
+                rawdata = f.read()
+            encoding = self.detect_encoding(rawdata) or 'utf-8'
+            try:
+                text = rawdata.decode(encoding, errors='replace')
+            except LookupError:
+                text = rawdata.decode('utf-8', errors='replace')
+
+            try:
+                return pd.read_csv(io.StringIO(text), engine='c')
+            except Exception as e:
+                raise ValueError(f"读取CSV文件失败: {str(e)}")
         
         # 尝试Excel格式
         if file_path.lower().endswith(('.xls', '.xlsx')):
             try:
-                return pd.read_excel(file_path)
+                try:
+                    # 优先使用calamine引擎，未安装时回退到pandas默认引擎
+                    return pd.read_excel(file_path, engine='calamine')
+                except (ImportError, ValueError):
+                    return pd.read_excel(file_path)
             except Exception as e:
                 raise ValueError(f"读取Excel文件失败: {str(e)}")
         
         raise ValueError("无法读取文件，请检查文件格式和编码")
 
     def split_pdf(self, pdf_path, output_folder, names):
-        """执行PDF拆分操作"""
+        """执行PDF拆分操作（在后台线程中运行，只更新进度计数，不操作界面）"""
         if not os.path.exists(pdf_path):
             raise FileNotFoundError("PDF文件不存在")
         
         with open(pdf_path, 'rb') as pdf_file:
-            reader = PyPDF2.PdfReader(pdf_file)
+            reader = pypdf.PdfReader(pdf_file)
             total_pages = len(reader.pages)
 
             if len(names) != total_pages:
@@ -110,28 +195,85 @@ class PDFSplitterApp:
                     "请确保名称文件包含与PDF页数相同的名称"
                 )
 
-            self.progress['maximum'] = total_pages
-            self.progress['value'] = 0
+            # 清理文件名中的非法字符
+            safe_names = _dedupe_names([
+                _UNSAFE_FILENAME_CHARS.sub('', str(name).strip()) or f"page_{i+1}"
+                for i, name in enumerate(names)
+            ])
 
-            for i, name in enumerate(names):
-                # 清理文件名中的非法字符
-                safe_name = "".join(
-                    c for c in str(name).strip() 
-                    if c.isalnum() or c in (' ', '_', '-', '(', ')', '（', '）')
-                ) or f"page_{i+1}"
-                
-                writer = PyPDF2.PdfWriter()
-                writer.add_page(reader.pages[i])
+            self._progress_total = total_pages
+            self._progress_n = 0
 
-                output_path = os.path.join(output_folder, f"{safe_name}.pdf")
-                with open(output_path, 'wb') as output_pdf:
-                    writer.write(output_pdf)
+            use_pool = total_pages >= PARALLEL_MIN_PAGES and (os.cpu_count() or 1) > 1
+            if not use_pool:
+                for i, safe_name in enumerate(safe_names):
+                    _write_page(reader, i, safe_name, output_folder)
+                    self._progress_n = i + 1
 
-                self.progress['value'] = i + 1
-                self.root.update()
+        if use_pool:
+            self.split_pdf_parallel(pdf_path, output_folder, safe_names)
+
+    def split_pdf_parallel(self, pdf_path, output_folder, safe_names):
+        """多进程拆分：按批次分发页面，汇总完成的页数"""
+        total_pages = len(safe_names)
+        cpus = os.cpu_count() or 1
+        # 每个进程领取多批任务，既能均衡负载又能让进度条平滑推进；
+        # 每批至少MIN_BATCH_PAGES页，使每次解析源PDF的开销分摊到多页
+        chunk_size = max(MIN_BATCH_PAGES, total_pages // (cpus * 8))
+        jobs = list(enumerate(safe_names))
+        batches = -(-total_pages // chunk_size)
+        # 批次少于CPU数时不启动多余的进程
+        workers = min(cpus, batches)
+
+        # 进程池在后台线程中创建，Linux默认的fork在多线程进程中可能死锁，统一使用spawn
+        with ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn')
+        ) as executor:
+            futures = [
+                executor.submit(_write_pages, pdf_path, output_folder, jobs[start:start + chunk_size])
+                for start in range(0, total_pages, chunk_size)
+            ]
+            for future in as_completed(futures):
+                self._progress_n += future.result()
+
+    def _do_split(self, pdf_path, output_folder, names):
+        """后台线程入口，记录拆分过程中的异常供界面线程处理"""
+        try:
+            self.split_pdf(pdf_path, output_folder, names)
+        except Exception as e:
+            self._split_error = e
+
+    def _refresh_progress(self, output_folder, names):
+        """界面线程定时轮询拆分进度，结束后给出提示"""
+        self.progress['maximum'] = max(1, self._progress_total)
+        self.progress['value'] = self._progress_n
+
+        if self._split_thread.is_alive():
+            self.root.after(PROGRESS_POLL_MS, self._refresh_progress, output_folder, names)
+            return
+
+        self._split_thread = None
+        self.start_button.state(['!disabled'])
+
+        if self._split_error is not None:
+            messagebox.showerror("错误", f"处理失败:\n{str(self._split_error)}")
+            self.progress['value'] = 0
+            return
+
+        # 完成提示
+        messagebox.showinfo(
+            "完成",
+            f"成功拆分 {len(names)} 页PDF到:\n{output_folder}\n\n"
+            f"首尾文件名示例:\n"
+            f"起始: {names[0] if len(names) > 0 else '无'}\n"
+            f"结束: {names[-1] if len(names) > 1 else '无'}"
+        )
 
     def start_split(self):
         """开始处理拆分流程"""
+        if self._split_thread is not None:
+            return
+
         pdf_path = self.pdf_entry.get()
         output_folder = self.output_entry.get()
         csv_path = self.csv_entry.get()
@@ -155,23 +297,24 @@ class PDFSplitterApp:
             # 获取名称列表（使用第一列）
             names = df.iloc[:, 0].astype(str).tolist()
             
-            # 执行拆分
-            self.split_pdf(pdf_path, output_folder, names)
-            
-            # 完成提示
-            messagebox.showinfo(
-                "完成",
-                f"成功拆分 {len(names)} 页PDF到:\n{output_folder}\n\n"
-                f"首尾文件名示例:\n"
-                f"起始: {names[0] if len(names) > 0 else '无'}\n"
-                f"结束: {names[-1] if len(names) > 1 else '无'}"
-            )
-            
         except Exception as e:
             messagebox.showerror("错误", f"处理失败:\n{str(e)}")
             self.progress['value'] = 0
+            return
+
+        # 在后台线程执行拆分，界面线程通过after轮询进度
+        self._progress_total = len(names)
+        self._progress_n = 0
+        self._split_error = None
+        self.start_button.state(['disabled'])
+        self._split_thread = threading.Thread(
+            target=self._do_split, args=(pdf_path, output_folder, names), daemon=True
+        )
+        self._split_thread.start()
+        self.root.after(PROGRESS_POLL_MS, self._refresh_progress, output_folder, names)
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()
     root = Tk()
     app = PDFSplitterApp(root)
     root.mainloop()
\ No newline at end of file